@@ -0,0 +1,89 @@
+"""
+Measures how long short lived workers take to import lockdown and build a
+large policy.
+
+    python benchmarks/startup.py [models] [roles]
+"""
+from __future__ import absolute_import, print_function
+import subprocess
+import sys
+import time
+
+
+IMPORT_SCRIPT = '''
+import sys, time
+start = time.time()
+import lockdown.model
+elapsed = time.time() - start
+print('%f %d' % (elapsed, 'flask' in sys.modules))
+'''
+
+
+def time_import(repeat=5):
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])
+        elapsed, flask_loaded = output.decode('utf-8').split()
+        if flask_loaded != '0':
+            raise AssertionError('importing lockdown.model imported flask')
+        timings.append(float(elapsed))
+    return min(timings)
+
+
+def build_policy(model_count, role_count):
+    import peewee
+    from lockdown import Role
+    from lockdown.context import ContextParam
+    from lockdown.model import SecureModel
+    from lockdown.policy import Policy
+    from lockdown.rules import NO_ONE
+
+    class BaseModel(SecureModel):
+        created = peewee.DateTimeField(null=True)
+        owner_id = peewee.IntegerField(null=True)
+        group_id = peewee.IntegerField(null=True)
+
+    models = [type('Model%d' % i, (BaseModel,), {
+        '__module__': __name__,
+        'name': peewee.CharField(null=True),
+    }) for i in range(model_count)]
+
+    start = time.time()
+    base = Role('base')
+    base.lockdown(BaseModel).field_writeable_by(BaseModel.created, NO_ONE)
+    roles = [base]
+    for i in range(role_count):
+        # every role extends the previous one and the base role, forming diamonds
+        role = Role('role%d' % i, [roles[-1], base])
+        for model_class in models[i % 10::10]:
+            role.lockdown(model_class) \
+                .readable_by(model_class.group_id == ContextParam('group')) \
+                .writeable_by(model_class.owner_id == ContextParam('user'))
+        roles.append(role)
+    roles_elapsed = time.time() - start
+
+    start = time.time()
+    policy = Policy(roles)
+    policy_elapsed = time.time() - start
+
+    start = time.time()
+    for model_class in models:
+        policy.get_rules(roles[-1].name, model_class)
+    lookup_elapsed = time.time() - start
+
+    return roles_elapsed, policy_elapsed, lookup_elapsed
+
+
+def main():
+    model_count = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    role_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    print('import lockdown.model: %.1fms' % (time_import() * 1000))
+    roles_elapsed, policy_elapsed, lookup_elapsed = build_policy(model_count, role_count)
+    print('build %d roles over %d models: %.1fms' % (role_count, model_count, roles_elapsed * 1000))
+    print('compile policy: %.1fms' % (policy_elapsed * 1000))
+    print('look up rules for every model: %.2fms' % (lookup_elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
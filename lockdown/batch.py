@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+
+from lockdown import LockdownException
+from lockdown.context import lockdown_context
+from lockdown.rules import BatchRule, rule_nodes
+
+
+def fetch(query, executor=None):
+    """
+    Runs a secure select and evaluates the `BatchRule` read rules of the model
+    for all rows before applying the read rules to each row. Batched rules are
+    called once for the whole result set, other batch rules are called per row
+    on `executor` (anything with a `map` method, e.g. a ThreadPoolExecutor) or
+    serially when no executor is given.
+    """
+    all_rules = lockdown_context.get_rules(query.model_class)
+    with lockdown_context.deferred_read_checks():
+        instances = list(query)
+
+    evaluate_batch_rules(instances, all_rules, executor)
+    try:
+        for instance in instances:
+            instance.apply_read_rules(all_rules)
+    finally:
+        # results are only valid for the current context
+        for instance in instances:
+            instance._batch_results.clear()
+    return instances
+
+
+def evaluate_batch_rules(instances, all_rules, executor=None):
+    batch_rules = find_batch_rules(all_rules)
+    if not instances or not batch_rules:
+        return
+
+    tasks = []
+    for rule in batch_rules:
+        if rule.batched:
+            tasks.append((rule, instances))
+        else:
+            tasks.extend((rule, instance) for instance in instances)
+
+    snapshot = lockdown_context.snapshot()
+
+    def run(task):
+        rule, arg = task
+        with lockdown_context.bind(snapshot):
+            return rule.func(arg)
+
+    if executor is None:
+        results = [rule.func(arg) for rule, arg in tasks]
+    else:
+        results = list(executor.map(run, tasks))
+
+    for (rule, arg), result in zip(tasks, results):
+        if rule.batched:
+            result = list(result)
+            if len(result) != len(instances):
+                raise LockdownException('Batched rule returned {count} results for {total} instances'.format(
+                    count=len(result), total=len(instances)))
+            for instance, value in zip(instances, result):
+                instance._batch_results[id(rule)] = value
+        else:
+            arg._batch_results[id(rule)] = result
+
+
+def find_batch_rules(all_rules):
+    found = []
+    seen = set()
+    for rules in all_rules:
+        for rule in [rules.read_rule] + list(rules.field_read_rules.values()):
+            if rule is None:
+                continue
+            for node in rule_nodes(rule):
+                if isinstance(node, BatchRule) and id(node) not in seen:
+                    seen.add(id(node))
+                    found.append(node)
+    return found
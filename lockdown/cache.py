@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+import time
+import weakref
+
+from lockdown.context import lockdown_context, rule_context_vars
+
+
+_caches = weakref.WeakSet()
+
+
+def notify_write(model_class):
+    for cache in list(_caches):
+        cache.invalidate(model_class)
+
+
+class QueryCache(object):
+    """
+    LRU/TTL cache of secure select results that can be shared across requests.
+
+    Entries are keyed on the compiled sql and params of the query, the rules
+    that secured it and the values of every context param those rules read, so
+    a row is only ever returned to a context that would have read it the same
+    way. Only the field masked data is kept, never `_secure_data`.
+
+    Writes through `SecureModel.save` and `delete_instance` invalidate the
+    model's entries. Writes made with update/delete queries or by other
+    processes are only picked up once the ttl expires.
+    """
+    def __init__(self, max_size=1000, ttl=60):
+        super(QueryCache, self).__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def execute(self, query):
+        key, all_rules = self.cache_key(query)
+        if key is None:
+            return list(query)
+
+        model_class = query.model_class
+        now = time.time()
+        rows = None
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                expires, rules, cached_rows = entry
+                if expires > now and all(a is b for a, b in zip(rules, all_rules)):
+                    self._entries[key] = entry
+                    rows = cached_rows
+            generation = self.generation(model_class)
+
+        if rows is not None:
+            return [self.restore(model_class, data) for data in rows]
+
+        instances = list(query)
+        rows = tuple(dict(instance._data) for instance in instances)
+
+        with self._lock:
+            # skip storing if a write invalidated the model while the query ran
+            if self.generation(model_class) == generation:
+                self._entries[key] = (now + self.ttl, all_rules, rows)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        return instances
+
+    def cache_key(self, query):
+        model_class = query.model_class
+        if query._tuples or query._dicts or any(query._joins.values()):
+            return None, None
+
+        all_rules = tuple(lockdown_context.get_rules(model_class))
+        context_vars = set()
+        for rules in all_rules:
+            for rule in [rules.read_rule] + list(rules.field_read_rules.values()):
+                if rule is None:
+                    continue
+                # callables can depend on anything, so their results can't be shared
+                if hasattr(rule, '__call__'):
+                    return None, None
+                context_vars.update(rule_context_vars(rule))
+
+        sql, params = query.sql()
+        key = (model_class,
+               sql,
+               tuple(params),
+               tuple(id(rules) for rules in all_rules),
+               tuple((var, getattr(lockdown_context, var, None)) for var in sorted(context_vars)))
+        try:
+            hash(key)
+        except TypeError:
+            return None, None
+        return key, all_rules
+
+    def restore(self, model_class, data):
+        instance = model_class()
+        instance._data = dict(data)
+        instance._validate = True
+        return instance
+
+    def generation(self, model_class):
+        return self._epoch, self._generations.get(model_class, 0)
+
+    def invalidate(self, model_class=None):
+        with self._lock:
+            if model_class is None:
+                self._entries.clear()
+                self._epoch += 1
+                return
+
+            self._generations[model_class] = self._generations.get(model_class, 0) + 1
+            for key in [key for key in self._entries if key[0] is model_class]:
+                del self._entries[key]
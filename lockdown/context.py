@@ -3,9 +3,14 @@ from contextlib import contextmanager
 import threading
 from peewee import Param
 
+from lockdown.rules import rule_nodes
+from lockdown.trace import Trace
+
 
 class LockdownContext(threading.local):
     role = None
+    defer_read_checks = False
+    tracer = None
 
     def get_rules(self, model_class):
         return self.role.get_rules(model_class) if self.role else []
@@ -22,6 +27,42 @@ class LockdownContext(threading.local):
         finally:
             self.role = old_role
 
+    @contextmanager
+    def trace(self):
+        old_tracer = self.tracer
+        self.tracer = Trace()
+        try:
+            yield self.tracer
+        finally:
+            self.tracer = old_tracer
+
+    @contextmanager
+    def deferred_read_checks(self):
+        old_defer = self.defer_read_checks
+        self.defer_read_checks = True
+        try:
+            yield
+        finally:
+            self.defer_read_checks = old_defer
+
+    def snapshot(self):
+        return dict(self.__dict__)
+
+    @contextmanager
+    def bind(self, snapshot):
+        """
+        Runs with the values of a `snapshot` taken on another thread, so work
+        handed to a thread pool sees the context of the thread that started it.
+        """
+        old_values = dict(self.__dict__)
+        self.__dict__.clear()
+        self.__dict__.update(snapshot)
+        try:
+            yield
+        finally:
+            self.__dict__.clear()
+            self.__dict__.update(old_values)
+
 
 lockdown_context = LockdownContext()
 
@@ -35,4 +76,8 @@ class ContextParam(Param):
         if name == 'value':
             return getattr(lockdown_context, self.context_var, None)
         else:
-            return super(ContextParam, self).__getattribute__(name)
\ No newline at end of file
+            return super(ContextParam, self).__getattribute__(name)
+
+
+def rule_context_vars(rule):
+    return set(node.context_var for node in rule_nodes(rule) if isinstance(node, ContextParam))
@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+from collections import namedtuple
+
+from peewee import Field
+
+from lockdown.policy import walk_roles, walk_subclasses
+from lockdown.rules import NO_ONE, EVERYONE
+
+
+class MissingIndex(namedtuple('MissingIndex', ('model_class', 'fields'))):
+    @property
+    def columns(self):
+        return tuple(field.db_column for field in self.fields)
+
+
+class IndexAdvisor(object):
+    """
+    Finds the columns each model's read rules filter on and reports the ones
+    the database has no index for. Every read rule becomes part of the WHERE
+    clause of `SecureModel.select`, so without an index every secure query is
+    a table scan.
+    """
+    def __init__(self, roles):
+        super(IndexAdvisor, self).__init__()
+        self.roles = list(walk_roles(roles))
+
+    def wanted_indexes(self):
+        """
+        Returns a dict of model class to the field tuples the read rules of some
+        role filter on together, keyed by their column names.
+        """
+        model_classes = set()
+        for role in self.roles:
+            for model_class in role.rules:
+                model_classes.update(walk_subclasses(model_class))
+
+        wanted = {}
+        for model_class in model_classes:
+            for role in self.roles:
+                groups = [()]
+                for rules in role.get_rules(model_class):
+                    if rules.read_rule is not None:
+                        groups = [a + b for a in groups for b in rule_field_groups(model_class, rules.read_rule)]
+
+                for group in groups:
+                    if group:
+                        fields = unique_fields(group)
+                        columns = tuple(field.db_column for field in fields)
+                        wanted.setdefault(model_class, {})[columns] = fields
+        return wanted
+
+    def missing_indexes(self, database=None):
+        missing = []
+        tables = {}
+        wanted = self.wanted_indexes()
+        for model_class in sorted(wanted, key=lambda model_class: model_class._meta.db_table):
+            groups = wanted[model_class]
+            db = database or model_class._meta.database
+            if db not in tables:
+                tables[db] = set(db.get_tables())
+            if model_class._meta.db_table not in tables[db]:
+                continue
+
+            indexed = [index.columns for index in db.get_indexes(model_class._meta.db_table)]
+            indexed.append([model_class._meta.primary_key.db_column])
+            for columns, fields in sorted(groups.items()):
+                if not is_indexed(columns, indexed):
+                    missing.append(MissingIndex(model_class, fields))
+        return missing
+
+    def sql(self, database=None):
+        statements = []
+        for index in self.missing_indexes(database):
+            db = database or index.model_class._meta.database
+            statements.append(db.compiler().create_index(index.model_class, list(index.fields), False)[0])
+        return statements
+
+    def create_missing(self, database=None):
+        missing = self.missing_indexes(database)
+        for index in missing:
+            db = database or index.model_class._meta.database
+            db.create_index(index.model_class, list(index.fields))
+        return missing
+
+
+def rule_field_groups(model_class, rule):
+    """
+    Returns the alternative groups of fields of `model_class` a rule filters
+    on. `a & b` filters on the fields of both sides together, while `a | b`
+    can use an index for each side.
+    """
+    if rule is NO_ONE or rule is EVERYONE or hasattr(rule, '__call__'):
+        return [()]
+    if rule.op == 'and':
+        return [a + b for a in rule_field_groups(model_class, rule.lhs)
+                for b in rule_field_groups(model_class, rule.rhs)]
+    if rule.op == 'or':
+        return rule_field_groups(model_class, rule.lhs) + rule_field_groups(model_class, rule.rhs)
+
+    fields = []
+    for operand in (rule.lhs, rule.rhs):
+        if isinstance(operand, Field) and issubclass(model_class, operand.model_class):
+            field = model_class._meta.fields.get(operand.name)
+            if field is not None:
+                fields.append(field)
+    return [tuple(fields)]
+
+
+def unique_fields(fields):
+    result = []
+    for field in fields:
+        if field.name not in [f.name for f in result]:
+            result.append(field)
+    return tuple(result)
+
+
+def is_indexed(columns, indexed_columns):
+    # the filters are equality checks so any index whose leading columns are
+    # exactly the wanted columns works, whatever their order
+    wanted = set(columns)
+    for index_columns in indexed_columns:
+        if set(index_columns[:len(wanted)]) == wanted:
+            return True
+    return False
@@ -1,16 +1,25 @@
 from __future__ import absolute_import
+from timeit import default_timer
 from peewee import Param, SelectQuery, Field
 
 from playhouse.signals import Model
 from lockdown import LockdownException
-from lockdown.context import lockdown_context
-from lockdown.rules import NO_ONE, EVERYONE
+from lockdown.cache import notify_write
+from lockdown.context import ContextParam, lockdown_context
+from lockdown.rules import NO_ONE, EVERYONE, BatchRule, rule_nodes
 
 
 class SecureModel(Model):
+    # set to a lockdown.rls.RowSecurity by `enforce_in_database` once the
+    # database enforces the read rules, which skips the read checks in
+    # select/prepared
+    _database_enforced = None
+
     def __init__(self, *args, **kwargs):
         self._secure_data = {}
         self._change_contexts = {}
+        self._batch_results = {}
+        self._rule_results = {}
         super(SecureModel, self).__init__(*args, **kwargs)
 
     def is_readable(self, all_rules=None):
@@ -18,7 +27,7 @@ class SecureModel(Model):
             all_rules = lockdown_context.get_rules(self.__class__)
 
         for rules in all_rules:
-            if rules.read_rule and not check_rule_expr(self, rules.read_rule):
+            if rules.read_rule and not self.check_rule(rules.read_rule, rules, 'read'):
                 return False
 
         return True
@@ -27,12 +36,13 @@ class SecureModel(Model):
         if all_rules is None:
             all_rules = lockdown_context.get_rules(self.__class__)
 
-        if not self.is_readable(all_rules):
+        # rows of database enforced models were already filtered by the database
+        if not self._database_enforced and not self.is_readable(all_rules):
             return False
 
         for rules in all_rules:
             field_rules = rules.field_read_rules.get(field.name)
-            if field_rules and not check_rule_expr(self, field_rules):
+            if field_rules and not self.check_rule(field_rules, rules, 'read', field.name):
                 return False
 
         return True
@@ -43,7 +53,7 @@ class SecureModel(Model):
             all_rules = lockdown_context.get_rules(cls)
 
         for rules in all_rules:
-            if rules.create_rule and not check_rule_expr(None, rules.create_rule):
+            if rules.create_rule and not check_create_rule(cls, rules):
                 return False
 
         return True
@@ -56,7 +66,7 @@ class SecureModel(Model):
             return False
 
         for rules in all_rules:
-            if rules.write_rule and not check_rule_expr(self, rules.write_rule):
+            if rules.write_rule and not self.check_rule(rules.write_rule, rules, 'write'):
                 return False
         return True
 
@@ -69,7 +79,7 @@ class SecureModel(Model):
 
         for rules in all_rules:
             field_rules = rules.field_write_rules.get(field.name)
-            if field_rules and not check_rule_expr(self, field_rules):
+            if field_rules and not self.check_rule(field_rules, rules, 'write', field.name):
                 return False
 
         return True
@@ -82,18 +92,80 @@ class SecureModel(Model):
             return False
 
         for rules in all_rules:
-            if rules.delete_rule and not check_rule_expr(self, rules.delete_rule):
+            if rules.delete_rule and not self.check_rule(rules.delete_rule, rules, 'delete'):
                 return False
 
         return True
 
+    def check_rule(self, rule, rules=None, action=None, field_name=None):
+        tracer = lockdown_context.tracer
+        if tracer is None:
+            return self.check_rule_cached(rule, rules)
+
+        start = default_timer()
+        result = self.check_rule_cached(rule, rules)
+        tracer.record(rules, action, self.__class__, field_name, rule_operands(self, rule),
+                      result, default_timer() - start)
+        return result
+
+    def check_rule_cached(self, rule, rules=None):
+        """
+        Checks a rule against this instance, reusing the last result as long as
+        none of the fields or context params the rule depends on changed.
+        """
+        if rules is None:
+            dependencies = rule_dependencies(rule)
+        else:
+            # kept on the rules so they go away with them
+            cached = rules.dependencies.get(id(rule))
+            if cached is None or cached[0] is not rule:
+                cached = rules.dependencies[id(rule)] = (rule, rule_dependencies(rule))
+            dependencies = cached[1]
+        if dependencies is None:
+            return check_rule_expr(self, rule)
+
+        field_names, context_vars = dependencies
+        state = (tuple(self._data.get(name) for name in field_names),
+                 tuple(getattr(lockdown_context, var, None) for var in context_vars))
+        cached = self._rule_results.get(id(rule))
+        if cached is not None and cached[0] is rule and cached[1] == state:
+            return cached[2]
+
+        result = check_rule_expr(self, rule)
+        self._rule_results[id(rule)] = (rule, state, result)
+        return result
+
+    def reauthorize(self):
+        """
+        Re-applies the read rules and field masks after the context (role, user,
+        ...) or the instance changed. Only the rules depending on something that
+        changed are evaluated again.
+        """
+        data = self._data
+        if self._secure_data:
+            self._data = dict(self._secure_data)
+            self._data.update(data)
+        try:
+            self.apply_read_rules(lockdown_context.get_rules(self.__class__))
+        except LockdownException:
+            # keep the fields masked when the instance is no longer readable
+            self._data = data
+            raise
+
     @classmethod
     def select(cls, *selection):
         query = cls.create_select_query(*selection)
-        all_rules = lockdown_context.get_rules(cls)
-        for rules in all_rules:
-            if rules.read_rule:
-                query = query.where(rules.read_rule)
+        if cls._database_enforced:
+            query = cls._database_enforced.secure_query(cls, query)
+        else:
+            all_rules = lockdown_context.get_rules(cls)
+            for rules in all_rules:
+                # callable rules can't be expressed in sql, prepared checks them per row
+                read_rule = sql_rule(rules.read_rule) if rules.read_rule else None
+                if read_rule is not None:
+                    query = query.where(read_rule)
+                    if lockdown_context.tracer is not None:
+                        lockdown_context.tracer.record(rules, 'select', cls, None, None, None, 0)
         if cls._meta.order_by:
             query = query.order_by(*cls._meta.order_by)
         return query
@@ -112,7 +184,7 @@ class SecureModel(Model):
         for rules in all_rules:
             validation_expr = rules.field_validation.get(field.name)
             if validation_expr:
-                if not self.check_field_validation(validation_expr, field, value):
+                if not self.check_traced_validation(rules, validation_expr, field, value):
                     if throw_exception:
                         raise LockdownException('Validation error for field {name}'.format(name=field.name))
                     else:
@@ -120,6 +192,17 @@ class SecureModel(Model):
 
         return True
 
+    def check_traced_validation(self, rules, validation_expr, field, value):
+        tracer = lockdown_context.tracer
+        if tracer is None:
+            return self.check_field_validation(validation_expr, field, value)
+
+        start = default_timer()
+        result = self.check_field_validation(validation_expr, field, value)
+        tracer.record(rules, 'validate', self.__class__, field.name, (resolve(self, value),),
+                      result, default_timer() - start)
+        return result
+
     def check_field_validation(self, validation_expr, field, value):
         if hasattr(validation_expr, '__call__'):
             return validation_expr(self, field, value)
@@ -171,15 +254,21 @@ class SecureModel(Model):
                 if change_context or self.check_field_writable(all_rules, field, value, False):
                     only.append(field)
 
-        return super(SecureModel, self).save(force_insert, only)
+        result = super(SecureModel, self).save(force_insert, only)
+        notify_write(self.__class__)
+        return result
 
     def prepared(self):
         super(SecureModel, self).prepared()
         self._validate = True
 
-        all_rules = lockdown_context.get_rules(self.__class__)
+        # lockdown.batch.fetch applies the read rules itself once all rows are loaded
+        if not lockdown_context.defer_read_checks:
+            self.apply_read_rules(lockdown_context.get_rules(self.__class__))
+
+    def apply_read_rules(self, all_rules):
         if all_rules:
-            if not self.is_readable(all_rules):
+            if not self._database_enforced and not self.is_readable(all_rules):
                 raise LockdownException('Model not readable in current context')
 
             to_remove = []
@@ -197,7 +286,74 @@ class SecureModel(Model):
     def delete_instance(self, recursive=False, delete_nullable=False):
         if not self.is_deleteable():
             raise LockdownException('Model not deletable in current context')
-        return super(SecureModel, self).delete_instance(recursive, delete_nullable)
+        result = super(SecureModel, self).delete_instance(recursive, delete_nullable)
+        notify_write(self.__class__)
+        return result
+
+
+def rule_dependencies(rule):
+    """
+    Returns the names of the fields and context params a rule reads, or None
+    when that can't be known because the rule calls out to python code.
+    """
+    field_names = set()
+    context_vars = set()
+    dependencies = None
+    for node in rule_nodes(rule):
+        if isinstance(node, Field):
+            field_names.add(node.name)
+        elif isinstance(node, ContextParam):
+            context_vars.add(node.context_var)
+        elif hasattr(node, '__call__') and not isinstance(node, type):
+            break
+    else:
+        dependencies = (tuple(sorted(field_names)), tuple(sorted(context_vars)))
+    return dependencies
+
+
+def sql_rule(rule):
+    """
+    Returns the part of a rule a query can filter on, or None when all of it
+    needs python. Callables nested in `&` are left out and callables under `|`
+    drop that whole `|`, so the query may return more rows than the rule
+    allows, but never fewer, and `prepared` checks the full rule per row.
+    """
+    if hasattr(rule, '__call__'):
+        return None
+    if not any(hasattr(node, '__call__') and not isinstance(node, type) for node in rule_nodes(rule)):
+        return rule
+    if getattr(rule, '_negated', False) or getattr(rule, 'op', None) not in ('and', 'or'):
+        return None
+
+    lhs = sql_rule(rule.lhs)
+    rhs = sql_rule(rule.rhs)
+    if rule.op == 'or':
+        return None if lhs is None or rhs is None else lhs | rhs
+    if lhs is None or rhs is None:
+        return rhs if lhs is None else lhs
+    return lhs & rhs
+
+
+def check_create_rule(model_class, rules):
+    tracer = lockdown_context.tracer
+    if tracer is None:
+        return check_rule_expr(None, rules.create_rule)
+
+    start = default_timer()
+    result = check_rule_expr(None, rules.create_rule)
+    tracer.record(rules, 'create', model_class, None, None, result, default_timer() - start)
+    return result
+
+
+def rule_operands(instance, rule):
+    """
+    Returns the resolved values a comparison rule compares, for traces.
+    """
+    if not hasattr(rule, 'op') or rule.op in ('and', 'or'):
+        return None
+    if rule.op == 'in':
+        return resolve(instance, rule.lhs), [resolve(instance, item) for item in rule.rhs]
+    return resolve(instance, rule.lhs), resolve(instance, rule.rhs)
 
 
 def check_rule_expr(instance, rule):
@@ -206,6 +362,8 @@ def check_rule_expr(instance, rule):
     elif rule is EVERYONE:
         return True
     elif hasattr(rule, '__call__'):
+        if isinstance(rule, BatchRule) and instance is not None and id(rule) in instance._batch_results:
+            return instance._batch_results[id(rule)]
         return rule(instance)
     else:
         if rule.op == 'and':
@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+import base64
+import datetime
+import decimal
+import hashlib
+import hmac
+import json
+import uuid
+
+from peewee import Model
+
+from lockdown import LockdownException
+from lockdown.context import lockdown_context, rule_context_vars
+from lockdown.rules import EVERYONE
+
+
+class KeysetPage(object):
+    def __init__(self, items, next_cursor):
+        super(KeysetPage, self).__init__()
+        self.items = items
+        self.next_cursor = next_cursor
+
+
+class KeysetPaginator(object):
+    """
+    Pages through a secure select with `(order fields) > (last seen values)`
+    instead of an OFFSET, so every page costs the same no matter how deep it
+    is. The read rules stay part of the query.
+
+    Cursors are opaque and signed with `secret`. They are bound to the role
+    and to the context params the model's read rules use, so a cursor handed
+    out in one context is rejected in any other. Ordering is ascending, and
+    the primary key is always added as the last order field to break ties.
+    Order fields must not be nullable, NULLs can't be ordered in a way an
+    index can serve on every database. Fields that have field read rules
+    can't be paged by, their values would leak through the cursor and the
+    page boundaries.
+    """
+    def __init__(self, secret, order_by=None, limit=20):
+        super(KeysetPaginator, self).__init__()
+        if not secret:
+            raise LockdownException('KeysetPaginator needs a secret to sign cursors')
+        self.order_by = list(order_by or [])
+        self.limit = limit
+        self.secret = secret
+
+    def order_fields(self, model_class):
+        primary_key = model_class._meta.primary_key
+        fields = [model_class._meta.fields[field.name] for field in self.order_by]
+        for field in fields:
+            if field.null:
+                raise LockdownException('Field {name} is nullable, can not page by it'.format(name=field.name))
+        if primary_key.name not in [field.name for field in fields]:
+            fields.append(primary_key)
+        return fields
+
+    def page_query(self, query, cursor=None, limit=None):
+        """
+        Returns the query fetching the page after `cursor`, with one extra row
+        to tell whether there is a next page.
+        """
+        model_class = query.model_class
+        fields = self.order_fields(model_class)
+        check_readable(model_class, fields)
+
+        query = query.order_by(*fields)
+        if cursor:
+            values = self.decode(model_class, cursor)
+            query = query.where(after(fields, values))
+        return query.limit((limit or self.limit) + 1)
+
+    def page(self, query, cursor=None, limit=None):
+        model_class = query.model_class
+        limit = limit or self.limit
+        fields = self.order_fields(model_class)
+
+        items = list(self.page_query(query, cursor, limit))
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = self.encode(model_class, fields, items[-1])
+        return KeysetPage(items, next_cursor)
+
+    def encode(self, model_class, fields, instance):
+        values = []
+        for field in fields:
+            # masked fields can't go into the cursor without leaking them
+            if field.name not in instance._data:
+                raise LockdownException('Field {name} not readable, can not page by it'.format(name=field.name))
+            values.append(to_json_value(instance._data[field.name]))
+
+        try:
+            payload = json.dumps([values, self.binding(model_class)]).encode('utf-8')
+        except TypeError:
+            raise LockdownException('Order field values of {model} can not go into a cursor'.format(
+                model=model_class.__name__))
+        return base64.urlsafe_b64encode(payload + b'.' + self.sign(payload)).decode('ascii')
+
+    def decode(self, model_class, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+            payload, signature = data.rsplit(b'.', 1)
+            if not hmac.compare_digest(signature, self.sign(payload)):
+                raise ValueError('bad signature')
+            values, binding = json.loads(payload.decode('utf-8'))
+        except (TypeError, ValueError):
+            raise LockdownException('Invalid cursor')
+
+        fields = self.order_fields(model_class)
+        if binding != self.binding(model_class) or len(values) != len(fields):
+            raise LockdownException('Cursor not valid in current context')
+        check_readable(model_class, fields)
+        return [field.python_value(value) for field, value in zip(fields, values)]
+
+    def binding(self, model_class):
+        context_vars = set()
+        for rules in lockdown_context.get_rules(model_class):
+            for rule in [rules.read_rule] + list(rules.field_read_rules.values()):
+                if rule is not None and not hasattr(rule, '__call__'):
+                    context_vars.update(rule_context_vars(rule))
+
+        role = lockdown_context.role
+        bound = [role.name if role else None]
+        for var in sorted(context_vars):
+            bound.append([var, to_json_value(getattr(lockdown_context, var, None))])
+        return hashlib.sha256(json.dumps(bound).encode('utf-8')).hexdigest()
+
+    def sign(self, payload):
+        secret = self.secret.encode('utf-8') if not isinstance(self.secret, bytes) else self.secret
+        return hmac.new(secret, payload, hashlib.sha256).hexdigest().encode('ascii')
+
+
+def check_readable(model_class, fields):
+    for rules in lockdown_context.get_rules(model_class):
+        for field in fields:
+            rule = rules.field_read_rules.get(field.name)
+            if rule is not None and rule is not EVERYONE:
+                raise LockdownException('Field {name} may be masked, can not page by it'.format(name=field.name))
+
+
+def after(fields, values):
+    """
+    Builds `(f1, f2, ...) > (v1, v2, ...)` as `f1 >= v1 AND (f1 > v1 OR (f2 >= v2 AND ...))`.
+    The leading `f1 >= v1` lets the database start an index scan at the cursor
+    and read rows in index order, instead of sorting every row after it.
+    """
+    expr = fields[-1] > values[-1]
+    for field, value in reversed(list(zip(fields[:-1], values[:-1]))):
+        expr = (field >= value) & ((field > value) | expr)
+    return expr
+
+
+def to_json_value(value):
+    if isinstance(value, Model):
+        return value.get_id()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time, decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
@@ -0,0 +1,152 @@
+from __future__ import absolute_import
+import pickle
+
+from lockdown import LockdownException
+
+
+class Policy(object):
+    """
+    Snapshot of a set of roles and the rules they apply to each model.
+
+    Building a policy walks every role (and its `from_roles`) once and stores
+    copies of the resolved rules for every known model as tuples, so lookups are
+    a dict access and changing the roles afterwards doesn't affect the policy.
+    Build it before forking workers to share it copy-on-write, or ship it between
+    processes with `dumps`/`loads`. Rules must be picklable for that to work, so
+    callable rules need to be module level functions rather than lambdas.
+    """
+    __slots__ = ('_roles',)
+
+    def __init__(self, roles):
+        all_roles = {}
+        for role in walk_roles(roles):
+            existing = all_roles.get(role.name)
+            if existing is not None and existing is not role:
+                raise LockdownException('Duplicate role name {name}'.format(name=role.name))
+            all_roles[role.name] = role
+
+        model_classes = set()
+        for role in all_roles.values():
+            for model_class in role.rules:
+                model_classes.update(walk_subclasses(model_class))
+
+        # a Rules object shared by several roles is copied once, so the copies
+        # are still de-duplicated by identity
+        copies = {}
+        compiled = {}
+        for name, role in all_roles.items():
+            compiled[name] = {}
+            for model_class, all_rules in role.collect_all_rules(model_classes).items():
+                for rules in all_rules:
+                    if id(rules) not in copies:
+                        copies[id(rules)] = rules.copy()
+                compiled[name][model_class] = tuple(copies[id(rules)] for rules in all_rules)
+        object.__setattr__(self, '_roles', compiled)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Policy is immutable')
+
+    def __reduce__(self):
+        return _load_policy, (self._roles,)
+
+    @property
+    def role_names(self):
+        return sorted(self._roles)
+
+    def role(self, name):
+        if name not in self._roles:
+            raise LockdownException('Unknown role {name}'.format(name=name))
+        return PolicyRole(name, self)
+
+    def get_rules(self, role_name, model_class):
+        model_rules = self._roles.get(role_name)
+        if model_rules is None:
+            raise LockdownException('Unknown role {name}'.format(name=role_name))
+
+        # models defined after the snapshot was taken can't have rules of their
+        # own, so they get the rules of their nearest known base class
+        while model_class is not None:
+            rules = model_rules.get(model_class)
+            if rules is not None:
+                return rules
+            model_class = model_class.__base__
+        return ()
+
+    def dumps(self):
+        return pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        policy = pickle.loads(data)
+        if not isinstance(policy, Policy):
+            raise LockdownException('Data is not a serialized policy')
+        return policy
+
+
+class PolicyRole(object):
+    """
+    Role handle that can be assigned to `lockdown_context.role`. It always
+    uses the policy it was created with, see `policy_role`.
+    """
+    def __init__(self, name, policy):
+        super(PolicyRole, self).__init__()
+        self.name = name
+        self.policy = policy
+
+    def get_rules(self, model_class):
+        return self.policy.get_rules(self.name, model_class)
+
+
+_active_policy = None
+
+
+def install(policy):
+    """
+    Make `policy` the process wide policy. Rebinding a module global is atomic,
+    and roles from `policy_role` keep the policy that was installed when they
+    were created, so a request set up before the swap finishes with the old
+    policy and never mixes the two.
+    """
+    global _active_policy
+    _active_policy = policy
+
+
+def active_policy():
+    return _active_policy
+
+
+def policy_role(name):
+    """
+    Returns the role `name` of the installed policy. Call it once when setting
+    up a request: `lockdown_context.role = policy_role('rest_api')`.
+    """
+    policy = _active_policy
+    if policy is None:
+        raise LockdownException('No policy installed')
+    return policy.role(name)
+
+
+def walk_roles(roles):
+    seen = set()
+    stack = list(roles)
+    while stack:
+        role = stack.pop()
+        if id(role) in seen:
+            continue
+        seen.add(id(role))
+        stack.extend(role.from_roles)
+        yield role
+
+
+def walk_subclasses(model_class):
+    stack = [model_class]
+    while stack:
+        cls = stack.pop()
+        yield cls
+        stack.extend(cls.__subclasses__())
+
+
+def _load_policy(compiled):
+    policy = Policy.__new__(Policy)
+    object.__setattr__(policy, '_roles', compiled)
+    return policy
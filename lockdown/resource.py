@@ -1,13 +1,24 @@
 from __future__ import absolute_import
 from contextlib import contextmanager
 
-from flask.ext.peewee.rest import RestResource
+from flask import request, url_for
+
+try:
+    from flask_peewee.rest import RestResource
+except ImportError:
+    # the flask.ext import hook scans every installed extension, only use it
+    # when flask_peewee isn't importable directly
+    from flask.ext.peewee.rest import RestResource
 from lockdown import LockdownException
 from lockdown.context import lockdown_context
 from lockdown.model import SecureModel
 
 
 class SecureRestResource(RestResource):
+    # set to a lockdown.pagination.KeysetPaginator to page lists with opaque
+    # `cursor` arguments instead of page numbers
+    keyset_paginator = None
+
     def check_get(self, obj=None):
         if obj is not None:
             return obj.is_readable()
@@ -26,6 +37,45 @@ class SecureRestResource(RestResource):
             return obj.is_deleteable()
         return super(SecureRestResource, self).check_delete(obj)
 
+    def paginated_object_list(self, filtered_query):
+        if self.keyset_paginator is None:
+            return super(SecureRestResource, self).paginated_object_list(filtered_query)
+
+        # the paginator orders by its own fields, it can't honor ?ordering=
+        if request.args.get('ordering'):
+            return self.response_bad_request()
+
+        try:
+            limit = int(request.args.get('limit', self.paginate_by))
+        except ValueError:
+            limit = self.paginate_by
+        else:
+            if self.paginate_by:
+                limit = min(limit, self.paginate_by)
+        # a negative limit means no limit at all in some databases
+        if limit is not None:
+            limit = max(limit, 1)
+
+        try:
+            page = self.keyset_paginator.page(filtered_query, request.args.get('cursor'), limit)
+        except LockdownException:
+            return self.response_bad_request()
+
+        next = ''
+        if page.next_cursor:
+            request_arguments = request.args.copy()
+            request_arguments['cursor'] = page.next_cursor
+            next = url_for(self.get_url_name('api_list'), **request_arguments)
+
+        return self.response({
+            'meta': {
+                'model': self.get_api_name(),
+                'cursor': page.next_cursor,
+                'next': next,
+            },
+            'objects': self.serialize_query(page.items),
+        })
+
     def prepare_data(self, obj, data):
         # remove any fields that are read-only in the current context
         # the data may have already been removed when the object was fetched,
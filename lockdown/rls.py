@@ -0,0 +1,359 @@
+from __future__ import absolute_import
+import datetime
+
+from peewee import Entity, Field, Model, Param
+
+from lockdown import LockdownException
+from lockdown.context import ContextParam, lockdown_context, rule_context_vars
+from lockdown.policy import walk_roles, walk_subclasses
+from lockdown.rules import NO_ONE, EVERYONE
+
+
+OPERATORS = {
+    '=': '=',
+    '!=': '<>',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+    'in': 'IN',
+    'not in': 'NOT IN',
+    'is': 'IS',
+    'is not': 'IS NOT',
+    'like': 'LIKE',
+    'ilike': 'ILIKE',
+}
+
+
+class RowSecurity(object):
+    """
+    Translates the read/create/write/delete rules of a set of roles into
+    statements that make the database enforce them. The current role and the
+    context params the rules use are passed to the database with
+    `apply_settings`, which `secure_query` calls before every select of a
+    database enforced model, so a connection never answers with the settings
+    of an earlier context.
+
+    Only expression rules can be translated, callable rules raise a
+    LockdownException. Field rules are not exported and are still enforced by
+    `SecureModel`.
+    """
+    settings_prefix = 'lockdown'
+    true = 'TRUE'
+    false = 'FALSE'
+
+    def __init__(self, roles, database=None, models=None):
+        super(RowSecurity, self).__init__()
+        self.roles = list(walk_roles(roles))
+        self.database = database
+        self.models = models
+        self._model_classes = None
+        self._context_vars = None
+
+    def model_classes(self):
+        """
+        Returns the models to export, `models` when given, otherwise every
+        model with rules whose table exists, so base classes like a shared
+        `BaseModel` without a table of their own are skipped. The tables are
+        looked up once, on the first call.
+        """
+        if self._model_classes is None:
+            self._model_classes = self.find_model_classes()
+        return self._model_classes
+
+    def find_model_classes(self):
+        if self.models is not None:
+            model_classes = set(self.models)
+        else:
+            model_classes = set()
+            tables = {}
+            for role in self.roles:
+                for model_class in role.rules:
+                    for cls in walk_subclasses(model_class):
+                        db = self.database or cls._meta.database
+                        if db not in tables:
+                            tables[db] = set(db.get_tables())
+                        if cls._meta.db_table in tables[db]:
+                            model_classes.add(cls)
+        return sorted(model_classes, key=lambda model_class: model_class._meta.db_table)
+
+    def context_vars(self):
+        if self._context_vars is None:
+            context_vars = set()
+            model_classes = self.model_classes()
+            for role in self.roles:
+                for model_class in model_classes:
+                    for rules in role.get_rules(model_class):
+                        for rule in (rules.read_rule, rules.create_rule, rules.write_rule, rules.delete_rule):
+                            if rule is not None:
+                                context_vars.update(rule_context_vars(rule))
+            self._context_vars = sorted(context_vars)
+        return self._context_vars
+
+    def statements(self):
+        raise NotImplementedError
+
+    def drop_statements(self):
+        raise NotImplementedError
+
+    def apply_settings(self, database):
+        raise NotImplementedError
+
+    def secure_query(self, model_class, query):
+        """
+        Applies the settings of the current context to the model's database
+        and returns the select query to run for a model enforced by it.
+        """
+        self.apply_settings(self.database or model_class._meta.database)
+        return query
+
+    def current_role(self):
+        role = lockdown_context.role
+        # roles that weren't exported have no policy and would see nothing
+        if role is not None and role.name not in [r.name for r in self.roles]:
+            raise LockdownException('Role {name} is not enforced by the database'.format(name=role.name))
+        return role
+
+    def settings(self):
+        role = self.current_role()
+        # no role means unrestricted, like in python, but the database only
+        # trusts an explicit setting, never a missing one
+        settings = [('role', role.name if role else None),
+                    ('unrestricted', 'true' if role is None else 'false')]
+        for var in self.context_vars():
+            settings.append((var, to_db_value(getattr(lockdown_context, var, None))))
+        return settings
+
+    def predicate(self, model_class, all_rules, attrs):
+        parts = []
+        for rules in all_rules:
+            for attr in attrs:
+                rule = getattr(rules, attr)
+                if rule is not None:
+                    parts.append(self.rule_sql(model_class, rule))
+        if not parts:
+            return self.true
+        return ' AND '.join(parts)
+
+    def role_predicate(self, model_class, role, attrs):
+        role_check = '{setting} = {name}'.format(setting=self.setting_sql('role'), name=self.literal(role.name))
+        predicate = self.predicate(model_class, role.get_rules(model_class), attrs)
+        return '({role_check} AND {predicate})'.format(role_check=role_check, predicate=predicate)
+
+    def rule_sql(self, model_class, rule, cast_to=None):
+        if rule is NO_ONE:
+            return self.false
+        if rule is EVERYONE:
+            return self.true
+        if hasattr(rule, '__call__'):
+            raise LockdownException('Callable rules can not be enforced by the database')
+
+        if isinstance(rule, Field):
+            if not issubclass(model_class, rule.model_class) or rule.name not in model_class._meta.fields:
+                raise LockdownException('Field {name} is not a field of {model}'.format(
+                    name=rule.name, model=model_class.__name__))
+            return quote(model_class._meta.fields[rule.name].db_column)
+        if isinstance(rule, ContextParam):
+            return self.setting_sql(rule.context_var, cast_to)
+        if isinstance(rule, (list, tuple)):
+            return '({items})'.format(items=', '.join(self.rule_sql(model_class, item, cast_to) for item in rule))
+        if isinstance(rule, Param):
+            return self.literal(rule.value)
+        if not hasattr(rule, 'op'):
+            return self.literal(rule)
+
+        if rule.op in ('and', 'or'):
+            sql = '({lhs} {op} {rhs})'.format(lhs=self.rule_sql(model_class, rule.lhs),
+                                              op=rule.op.upper(),
+                                              rhs=self.rule_sql(model_class, rule.rhs))
+        else:
+            op = OPERATORS.get(rule.op)
+            if op is None:
+                raise LockdownException('Operator {op} can not be enforced by the database'.format(op=rule.op))
+            lhs_cast = self.field_type(model_class, rule.rhs)
+            rhs_cast = self.field_type(model_class, rule.lhs)
+            sql = '{lhs} {op} {rhs}'.format(lhs=self.rule_sql(model_class, rule.lhs, lhs_cast),
+                                            op=self.operator(op),
+                                            rhs=self.rule_sql(model_class, rule.rhs, rhs_cast))
+
+        if getattr(rule, '_negated', False):
+            sql = 'NOT ({sql})'.format(sql=sql)
+        return sql
+
+    def field_type(self, model_class, value):
+        return None
+
+    def operator(self, op):
+        return op
+
+    def setting_sql(self, name, cast_to=None):
+        raise NotImplementedError
+
+    def literal(self, value):
+        value = to_db_value(value)
+        if value is None:
+            return 'NULL'
+        if value is True:
+            return self.true
+        if value is False:
+            return self.false
+        if isinstance(value, (int, float)):
+            return str(value)
+        return "'{value}'".format(value=str(value).replace("'", "''"))
+
+
+class PostgresRowSecurity(RowSecurity):
+    """
+    Exports rules as PostgreSQL row level security policies. The role and
+    context params are read from `lockdown.*` settings, which `apply_settings`
+    sets for the current transaction only, so selects of database enforced
+    models must run inside a transaction (`database.atomic()`). Like in
+    python, a context without a role (e.g. server jobs) is unrestricted, but
+    only once that was set explicitly, a connection without settings sees
+    nothing.
+    """
+    def statements(self):
+        statements = []
+        for model_class in self.model_classes():
+            table = quote(model_class._meta.db_table)
+            statements.append('ALTER TABLE {table} ENABLE ROW LEVEL SECURITY'.format(table=table))
+            statements.append('ALTER TABLE {table} FORCE ROW LEVEL SECURITY'.format(table=table))
+            statements.append('CREATE POLICY {name} ON {table} FOR ALL USING ({setting} = {true})'.format(
+                name=quote('lockdown_unrestricted'), table=table, setting=self.setting_sql('unrestricted'),
+                true=self.literal('true')))
+            for role in self.roles:
+                policies = [
+                    ('select', 'USING', ('read_rule',)),
+                    ('insert', 'WITH CHECK', ('create_rule',)),
+                    ('update', 'USING', ('read_rule', 'write_rule')),
+                    ('delete', 'USING', ('read_rule', 'write_rule', 'delete_rule')),
+                ]
+                for action, clause, attrs in policies:
+                    name = quote('lockdown_{role}_{action}'.format(role=role.name, action=action))
+                    statements.append('CREATE POLICY {name} ON {table} FOR {action} {clause} {predicate}'.format(
+                        name=name, table=table, action=action.upper(), clause=clause,
+                        predicate=self.role_predicate(model_class, role, attrs)))
+        return statements
+
+    def drop_statements(self):
+        statements = []
+        for model_class in self.model_classes():
+            statements.append('DROP POLICY IF EXISTS {name} ON {table}'.format(
+                name=quote('lockdown_unrestricted'), table=quote(model_class._meta.db_table)))
+            for role in self.roles:
+                for action in ('select', 'insert', 'update', 'delete'):
+                    statements.append('DROP POLICY IF EXISTS {name} ON {table}'.format(
+                        name=quote('lockdown_{role}_{action}'.format(role=role.name, action=action)),
+                        table=quote(model_class._meta.db_table)))
+        return statements
+
+    def apply_settings(self, database):
+        settings = self.settings()
+        params = []
+        for name, value in settings:
+            params.extend(('{prefix}.{name}'.format(prefix=self.settings_prefix, name=name),
+                           '' if value is None else str(value)))
+        database.execute_sql('SELECT {calls}'.format(
+            calls=', '.join(['set_config(%s, %s, true)'] * len(settings))), params)
+
+    def secure_query(self, model_class, query):
+        database = self.database or model_class._meta.database
+        # transaction local settings would be gone before the query runs
+        if database.get_autocommit() and database.transaction_depth() == 0:
+            raise LockdownException('Database enforced models must be selected inside a transaction')
+        return super(PostgresRowSecurity, self).secure_query(model_class, query)
+
+    def field_type(self, model_class, value):
+        if not isinstance(value, Field) or value.name not in model_class._meta.fields:
+            return None
+        db_field = model_class._meta.fields[value.name].get_db_field()
+        if db_field == 'primary_key':
+            db_field = 'int'
+        database = self.database or model_class._meta.database
+        return database.compiler().get_column_type(db_field)
+
+    def setting_sql(self, name, cast_to=None):
+        sql = "NULLIF(current_setting('{prefix}.{name}', true), '')".format(prefix=self.settings_prefix, name=name)
+        if cast_to:
+            sql = 'CAST({sql} AS {cast_to})'.format(sql=sql, cast_to=cast_to)
+        return sql
+
+
+class SqliteRowSecurity(RowSecurity):
+    """
+    Exports rules as SQLite views, one per role and model, named
+    `<role>_<table>`. SQLite has no session settings, so the role and context
+    params live in a temporary `lockdown_settings` table. Both the table and
+    the views are temporary, so the statements need to run on every connection.
+    Database enforced models select from the view of the current role.
+    """
+    true = '1'
+    false = '0'
+    settings_table = 'lockdown_settings'
+
+    def statements(self):
+        statements = ['CREATE TEMP TABLE IF NOT EXISTS {table} (name TEXT PRIMARY KEY, value)'.format(
+            table=quote(self.settings_table))]
+        for model_class in self.model_classes():
+            for role in self.roles:
+                statements.append('CREATE TEMP VIEW {view} AS SELECT * FROM {table} WHERE {predicate}'.format(
+                    view=quote(self.view_name(model_class, role)),
+                    table=quote(model_class._meta.db_table),
+                    predicate=self.role_predicate(model_class, role, ('read_rule',))))
+        return statements
+
+    def drop_statements(self):
+        statements = []
+        for model_class in self.model_classes():
+            for role in self.roles:
+                statements.append('DROP VIEW IF EXISTS {view}'.format(
+                    view=quote(self.view_name(model_class, role))))
+        return statements
+
+    def apply_settings(self, database):
+        settings = self.settings()
+        params = []
+        for name, value in settings:
+            params.extend((name, value))
+        database.execute_sql('INSERT OR REPLACE INTO {table} (name, value) VALUES {rows}'.format(
+            table=quote(self.settings_table), rows=', '.join(['(?, ?)'] * len(settings))), params)
+
+    def secure_query(self, model_class, query):
+        query = super(SqliteRowSecurity, self).secure_query(model_class, query)
+        role = lockdown_context.role
+        if role is None:
+            return query
+        # t1 is the alias peewee gives the model the query selects from
+        return query.from_(Entity(self.view_name(model_class, role)).alias('t1'))
+
+    def view_name(self, model_class, role):
+        return '{role}_{table}'.format(role=role.name, table=model_class._meta.db_table)
+
+    def operator(self, op):
+        return 'LIKE' if op == 'ILIKE' else op
+
+    def setting_sql(self, name, cast_to=None):
+        return '(SELECT value FROM {table} WHERE name = {name})'.format(
+            table=quote(self.settings_table), name=self.literal(name))
+
+
+def enforce_in_database(row_security, *model_classes):
+    """
+    Turns off the read rule checks `SecureModel` makes in `select` and
+    `prepared` for models whose read rules `row_security` has exported to the
+    database, and lets it route their selects (to the role's view on SQLite).
+    """
+    for model_class in model_classes:
+        model_class._database_enforced = row_security
+
+
+def quote(name):
+    return '"{name}"'.format(name=name.replace('"', '""'))
+
+
+def to_db_value(value):
+    if isinstance(value, Model):
+        return value.get_id()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return str(value)
+    return value
@@ -13,7 +13,7 @@ class Role(object):
         return Role(name, [self])
 
     def lockdown(self, model_class):
-        rules = Rules(model_class)
+        rules = Rules(model_class, self)
         self.rules[model_class] = rules
         return rules
 
@@ -21,12 +21,69 @@ class Role(object):
         return self.collect_rules(model_class, [])
 
     def collect_rules(self, model_class, list):
-        for role in self.from_roles:
-            role.collect_rules(model_class, list)
-        rules = self.rules.get(model_class)
-        if rules:
-            list.append(rules)
-        if model_class.__base__:
-            self.collect_rules(model_class.__base__, list)
+        # each Rules object is collected once, even when roles form a diamond
+        # or the same role is reached through several model base classes
+        seen = set(id(rules) for rules in list)
+        model_classes = []
+        while model_class:
+            model_classes.append(model_class)
+            model_class = model_class.__base__
+
+        for role in self.linearize():
+            for model_class in model_classes:
+                rules = role.rules.get(model_class)
+                if rules and id(rules) not in seen:
+                    seen.add(id(rules))
+                    list.append(rules)
         return list
 
+    def collect_all_rules(self, model_classes):
+        """
+        Same as calling `get_rules` for each model class, but linearizes the
+        roles only once, which keeps compiling large policies fast. Used by
+        `Policy`, single lookups go through `collect_rules`.
+        """
+        by_class = {}
+        for position, role in enumerate(self.linearize()):
+            for model_class, rules in role.rules.items():
+                by_class.setdefault(model_class, []).append((position, rules))
+
+        all_rules = {}
+        for model_class in model_classes:
+            found = []
+            depth = 0
+            cls = model_class
+            while cls:
+                for position, rules in by_class.get(cls, ()):
+                    if rules:
+                        found.append((position, depth, rules))
+                depth += 1
+                cls = cls.__base__
+
+            found.sort(key=lambda item: item[:2])
+            seen = set()
+            all_rules[model_class] = []
+            for position, depth, rules in found:
+                if id(rules) not in seen:
+                    seen.add(id(rules))
+                    all_rules[model_class].append(rules)
+        return all_rules
+
+    def linearize(self):
+        """
+        Returns this role and every role it extends, each exactly once, ordered
+        so that a role always comes after the roles it is extended from.
+        """
+        order = []
+        seen = set()
+        stack = [(self, False)]
+        while stack:
+            role, expanded = stack.pop()
+            if expanded:
+                order.append(role)
+            elif id(role) not in seen:
+                seen.add(id(role))
+                stack.append((role, True))
+                for parent in reversed(role.from_roles):
+                    stack.append((parent, False))
+        return order
@@ -6,9 +6,11 @@ NO_ONE = '~~NO_ONE~~'
 
 
 class Rules(object):
-    def __init__(self, model_class):
+    def __init__(self, model_class, role=None):
         super(Rules, self).__init__()
         self.model_class = model_class
+        self.role = role
+        self.role_name = role.name if role is not None else None
         self.read_rule = None
         self.field_read_rules = {}
         self.create_rule = None
@@ -16,6 +18,22 @@ class Rules(object):
         self.field_write_rules = {}
         self.field_validation = {}
         self.delete_rule = None
+        # what each rule reads, filled in by `SecureModel.check_rule_cached`
+        self.dependencies = {}
+
+    def copy(self):
+        # the copy only keeps the role's name, a live Role would drag the
+        # whole mutable role graph along into snapshots
+        rules = Rules(self.model_class)
+        rules.role_name = self.role_name
+        rules.read_rule = self.read_rule
+        rules.field_read_rules = dict(self.field_read_rules)
+        rules.create_rule = self.create_rule
+        rules.write_rule = self.write_rule
+        rules.field_write_rules = dict(self.field_write_rules)
+        rules.field_validation = dict(self.field_validation)
+        rules.delete_rule = self.delete_rule
+        return rules
 
     def readable_by(self, expr):
         self.read_rule = expr
@@ -44,3 +62,46 @@ class Rules(object):
     def deleteable_by(self, expr):
         self.delete_rule = expr
         return self
+
+
+class BatchRule(object):
+    """
+    Callable rule that `lockdown.batch.fetch` evaluates for a whole result set
+    at once, either concurrently per instance on an executor, or, when
+    `batched`, with a single call taking the list of instances and returning a
+    list of results. Called with a single instance it behaves like any other
+    callable rule.
+    """
+    def __init__(self, func, batched=False):
+        super(BatchRule, self).__init__()
+        self.func = func
+        self.batched = batched
+
+    def __call__(self, instance):
+        if self.batched:
+            return self.func([instance])[0]
+        return self.func(instance)
+
+
+def batchable(func):
+    return BatchRule(func)
+
+
+def batched(func):
+    return BatchRule(func, batched=True)
+
+
+def rule_nodes(rule):
+    """
+    Yields a rule and every operand nested inside it, so callers can find the
+    fields and context params a rule expression refers to.
+    """
+    stack = [rule]
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, (list, tuple)):
+            stack.extend(node)
+        elif hasattr(node, 'lhs') and hasattr(node, 'op'):
+            stack.append(node.rhs)
+            stack.append(node.lhs)
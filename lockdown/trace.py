@@ -0,0 +1,61 @@
+from __future__ import absolute_import
+from collections import namedtuple
+
+
+TraceRecord = namedtuple('TraceRecord', (
+    'role', 'source', 'model', 'action', 'field', 'operands', 'result', 'elapsed'))
+
+
+class Trace(object):
+    """
+    Records every rule evaluated while `lockdown_context.trace()` is active:
+    the role and model that defined the rules (`role`, `source`), the model the
+    rule was checked on, the action (read, write, create, delete, validate or
+    select), the field for field rules, the compared values, the result and
+    how long the check took in seconds.
+    """
+    def __init__(self):
+        super(Trace, self).__init__()
+        self.records = []
+
+    def record(self, rules, action, model_class, field_name, operands, result, elapsed):
+        source = getattr(rules, 'model_class', None)
+        self.records.append(TraceRecord(
+            getattr(rules, 'role_name', None),
+            source.__name__ if source is not None else None,
+            model_class.__name__,
+            action,
+            field_name,
+            operands,
+            result,
+            elapsed))
+
+    def export(self):
+        return [record._asdict() for record in self.records]
+
+    def profile(self):
+        """
+        Returns one entry per role, rules model, model, action and field with
+        the number of checks, how many were denied and the total and max time.
+        """
+        entries = {}
+        for record in self.records:
+            key = (record.role, record.source, record.model, record.action, record.field)
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = {
+                    'role': record.role,
+                    'source': record.source,
+                    'model': record.model,
+                    'action': record.action,
+                    'field': record.field,
+                    'count': 0,
+                    'denied': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                }
+            entry['count'] += 1
+            entry['denied'] += 1 if record.result is False else 0
+            entry['total'] += record.elapsed
+            entry['max'] = max(entry['max'], record.elapsed)
+        return sorted(entries.values(), key=lambda entry: entry['total'], reverse=True)
@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from nose import with_setup
+
+from playhouse.test_utils import test_database
+from lockdown import Role, LockdownException
+from lockdown.batch import fetch
+from lockdown.context import ContextParam, lockdown_context
+from lockdown.rules import batchable, batched
+from tests import test_db, Bicycle, User, Group
+
+
+def setup():
+    lockdown_context.role = None
+    lockdown_context.user = None
+    lockdown_context.group = None
+
+
+@with_setup(setup)
+def test_batched_rules():
+    calls = []
+
+    @batched
+    def serial_visible(bikes):
+        calls.append(len(bikes))
+        return [b.serial != 'hidden' for b in bikes]
+
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle) \
+        .readable_by(Bicycle.group == ContextParam('group')) \
+        .field_readable_by(Bicycle.serial, serial_visible)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        g = Group.create(name='test')
+        for serial in ['1', 'hidden', '3']:
+            Bicycle.create(group=g, serial=serial)
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g.id
+
+        bikes = fetch(Bicycle.select().order_by(Bicycle.id))
+        assert [b.serial for b in bikes] == ['1', None, '3']
+        # a single call for the whole result set
+        assert calls == [3]
+
+        # outside of fetch the rule still works one instance at a time
+        assert [b.serial for b in Bicycle.select().order_by(Bicycle.id)] == ['1', None, '3']
+
+
+@with_setup(setup)
+def test_batchable_rules_executor():
+    threads = set()
+
+    @batchable
+    def same_group(bike):
+        threads.add(threading.current_thread().name)
+        # the context of the calling thread is visible on the pool threads
+        return bike._data['group'] == lockdown_context.group
+
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle).readable_by(same_group)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        g1 = Group.create(name='test1')
+        g2 = Group.create(name='test2')
+        Bicycle.create(group=g1)
+        Bicycle.create(group=g1)
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g1.id
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            bikes = fetch(Bicycle.select(), executor)
+            assert len(bikes) == 2
+            assert threading.current_thread().name not in threads
+
+            lockdown_context.group = g2.id
+            try:
+                fetch(Bicycle.select(), executor)
+                assert False, 'should have failed'
+            except LockdownException:
+                pass
+        finally:
+            executor.shutdown()
+
+
+@with_setup(setup)
+def test_nested_batch_rules():
+    calls = []
+
+    @batched
+    def acl(bikes):
+        calls.append(len(bikes))
+        return [b.serial != 'hidden' for b in bikes]
+
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle).readable_by((Bicycle.group == ContextParam('group')) & acl)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        g1 = Group.create(name='test1')
+        g2 = Group.create(name='test2')
+        Bicycle.create(group=g1, serial='1')
+        Bicycle.create(group=g1, serial='2')
+        Bicycle.create(group=g2, serial='hidden')
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g1.id
+
+        # the query filters on the group, the nested rule is checked per row
+        sql, params = Bicycle.select().sql()
+        assert params == [g1.id]
+        assert [b.serial for b in fetch(Bicycle.select().order_by(Bicycle.id))] == ['1', '2']
+        assert calls == [2]
+
+        lockdown_context.group = g2.id
+        try:
+            fetch(Bicycle.select())
+            assert False, 'should have failed'
+        except LockdownException:
+            pass
+
+        # a callable under | leaves nothing the query can filter on
+        rest_api.lockdown(Bicycle).readable_by((Bicycle.group == ContextParam('group')) | acl)
+        sql, params = Bicycle.select().sql()
+        assert 'WHERE' not in sql
+        assert len(fetch(Bicycle.select())) == 3
@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+from nose import with_setup
+
+from playhouse.test_utils import test_database
+from lockdown import Role
+from lockdown.cache import QueryCache
+from lockdown.context import ContextParam, lockdown_context
+from tests import test_db, Bicycle, User, Group
+
+
+def setup():
+    lockdown_context.role = None
+    lockdown_context.user = None
+    lockdown_context.group = None
+
+
+@with_setup(setup)
+def test_cache_role_binding():
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle) \
+        .readable_by(Bicycle.group == ContextParam('group')) \
+        .field_readable_by(Bicycle.serial, Bicycle.owner == ContextParam('user'))
+
+    cache = QueryCache()
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        u = User.create(username='test')
+        g = Group.create(name='test')
+        Bicycle.create(owner=u, group=g, serial='1')
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g.id
+        lockdown_context.user = u.id
+
+        bikes = cache.execute(Bicycle.select())
+        assert [b.serial for b in bikes] == ['1']
+
+        # same query from cache, but the delete below bypasses save/delete_instance
+        Bicycle.delete().execute()
+        bikes = cache.execute(Bicycle.select())
+        assert [b.serial for b in bikes] == ['1']
+
+        # user isn't part of the sql, but does change the field mask
+        lockdown_context.user = u.id + 1
+        bikes = cache.execute(Bicycle.select())
+        assert bikes == []
+
+        # a different group gets its own entry
+        lockdown_context.user = u.id
+        lockdown_context.group = g.id + 1
+        assert cache.execute(Bicycle.select()) == []
+
+
+@with_setup(setup)
+def test_cache_field_mask():
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle) \
+        .field_readable_by(Bicycle.serial, Bicycle.owner == ContextParam('user'))
+
+    cache = QueryCache()
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        u = User.create(username='test')
+        Bicycle.create(owner=u, serial='1')
+
+        lockdown_context.role = rest_api
+        lockdown_context.user = u.id + 1
+
+        bikes = cache.execute(Bicycle.select())
+        assert bikes[0].serial is None
+
+        bikes = cache.execute(Bicycle.select())
+        assert bikes[0].serial is None
+        assert bikes[0]._secure_data == {}
+
+        lockdown_context.user = u.id
+        bikes = cache.execute(Bicycle.select())
+        assert bikes[0].serial == '1'
+
+
+@with_setup(setup)
+def test_cache_invalidation():
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle).readable_by(Bicycle.group == ContextParam('group'))
+
+    cache = QueryCache(max_size=1)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        g = Group.create(name='test')
+        b = Bicycle.create(group=g, serial='1')
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g.id
+
+        assert len(cache.execute(Bicycle.select())) == 1
+
+        Bicycle.create(group=g, serial='2')
+        assert len(cache.execute(Bicycle.select())) == 2
+
+        b.delete_instance()
+        assert len(cache.execute(Bicycle.select())) == 1
+
+        # evicted by the second query, max_size is 1
+        cache.execute(Bicycle.select().where(Bicycle.serial == '2'))
+        Bicycle.delete().execute()
+        assert len(cache.execute(Bicycle.select())) == 0
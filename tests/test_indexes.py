@@ -0,0 +1,39 @@
+from __future__ import absolute_import
+
+from playhouse.test_utils import test_database
+from lockdown import Role
+from lockdown.context import ContextParam
+from lockdown.indexes import IndexAdvisor
+from tests import test_db, Bicycle, User, Group
+
+
+def test_index_advisor():
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle).readable_by(Bicycle.group == ContextParam('group'))
+
+    owner_api = rest_api.extend('owner_api')
+    owner_api.lockdown(Bicycle).readable_by(
+        (Bicycle.owner == ContextParam('user')) & (Bicycle.serial == ContextParam('serial')))
+
+    user_api = Role('user_api')
+    user_api.lockdown(User).readable_by(
+        (User.id == ContextParam('user')) | (User.username == ContextParam('username')))
+
+    advisor = IndexAdvisor([owner_api, user_api])
+    wanted = advisor.wanted_indexes()
+    assert sorted(wanted[Bicycle]) == [('group_id',), ('group_id', 'owner_id', 'serial')]
+    assert sorted(wanted[User]) == [('id',), ('username',)]
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        # foreign keys are indexed and id is the primary key
+        missing = advisor.missing_indexes()
+        assert [(m.model_class, m.columns) for m in missing] == [
+            (Bicycle, ('group_id', 'owner_id', 'serial')),
+            (User, ('username',))]
+
+        sql = advisor.sql()
+        assert sql[0] == 'CREATE INDEX "bicycle_group_id_owner_id_serial" ON "bicycle" ' \
+                         '("group_id", "owner_id", "serial")'
+
+        advisor.create_missing()
+        assert advisor.missing_indexes() == []
@@ -0,0 +1,129 @@
+from __future__ import absolute_import
+import datetime
+import decimal
+import uuid
+from nose import with_setup
+
+from playhouse.test_utils import test_database
+from lockdown import Role, LockdownException
+from lockdown.context import ContextParam, lockdown_context
+from lockdown.pagination import KeysetPaginator, to_json_value
+from tests import test_db, Bicycle, User, Group
+
+
+def setup():
+    lockdown_context.role = None
+    lockdown_context.user = None
+    lockdown_context.group = None
+
+
+@with_setup(setup)
+def test_keyset_pagination():
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle).readable_by(Bicycle.group == ContextParam('group'))
+
+    paginator = KeysetPaginator('secret', order_by=[Bicycle.created], limit=2)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        g1 = Group.create(name='test1')
+        g2 = Group.create(name='test2')
+        for serial, day in [('e', 5), ('a', 1), ('c', 3), ('c', 3), ('b', 2)]:
+            Bicycle.create(group=g1, serial=serial, created=datetime.datetime(2020, 1, day))
+        Bicycle.create(group=g2, serial='a', created=datetime.datetime(2020, 1, 1))
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g1.id
+
+        serials = []
+        cursor = None
+        pages = 0
+        while True:
+            page = paginator.page(Bicycle.select(), cursor)
+            pages += 1
+            serials.extend(b.serial for b in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+            sql, params = paginator.page_query(Bicycle.select(), cursor).sql()
+            assert 'OFFSET' not in sql
+            assert sql.endswith('LIMIT 3')
+            assert sql.count('"created" >') == 2
+
+        assert serials == ['a', 'b', 'c', 'c', 'e']
+        assert pages == 3
+
+        page = paginator.page(Bicycle.select())
+        cursor = page.next_cursor
+
+        # the cursor can't be tampered with
+        try:
+            paginator.page(Bicycle.select(), cursor[:-4] + 'AAAA')
+            assert False, 'should have failed'
+        except LockdownException:
+            pass
+
+        # or used in another context
+        lockdown_context.group = g2.id
+        try:
+            paginator.page(Bicycle.select(), cursor)
+            assert False, 'should have failed'
+        except LockdownException:
+            pass
+
+        lockdown_context.group = g1.id
+        assert [b.serial for b in paginator.page(Bicycle.select(), cursor).items] == ['c', 'c']
+
+
+
+@with_setup(setup)
+def test_keyset_pagination_nullable_fields():
+    paginator = KeysetPaginator('secret', order_by=[Bicycle.serial])
+
+    # NULLs have no index friendly position in the order
+    try:
+        paginator.page(Bicycle.select())
+        assert False, 'should have failed'
+    except LockdownException:
+        pass
+
+
+def test_cursor_values():
+    assert to_json_value(decimal.Decimal('1.50')) == '1.50'
+    value = uuid.uuid4()
+    assert to_json_value(value) == str(value)
+
+
+@with_setup(setup)
+def test_keyset_pagination_masked_fields():
+    try:
+        KeysetPaginator('')
+        assert False, 'should have failed, cursors must be signed'
+    except LockdownException:
+        pass
+
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle).field_readable_by(Bicycle.created, Bicycle.owner == ContextParam('user'))
+    paginator = KeysetPaginator('secret', order_by=[Bicycle.created], limit=1)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        u = User.create(username='test')
+        Bicycle.create(owner=u, serial='a')
+        Bicycle.create(owner=u, serial='b')
+
+        lockdown_context.role = rest_api
+        lockdown_context.user = u.id
+        bike = Bicycle.select().order_by(Bicycle.id).get()
+        assert bike.created is not None
+
+        # even a validly signed cursor can't page by a field that may be masked
+        cursor = paginator.encode(Bicycle, paginator.order_fields(Bicycle), bike)
+        try:
+            paginator.decode(Bicycle, cursor)
+            assert False, 'should have failed'
+        except LockdownException:
+            pass
+        try:
+            paginator.page(Bicycle.select())
+            assert False, 'should have failed'
+        except LockdownException:
+            pass
@@ -0,0 +1,117 @@
+from __future__ import absolute_import
+from nose import with_setup
+
+from playhouse.test_utils import test_database
+from lockdown import Role, LockdownException
+from lockdown.context import ContextParam, lockdown_context
+from lockdown.policy import Policy, install, policy_role
+from lockdown.rules import NO_ONE
+from tests import test_db, Bicycle, User, Group, BaseModel
+
+
+def setup():
+    lockdown_context.role = None
+    lockdown_context.user = None
+    lockdown_context.group = None
+    install(None)
+
+
+def build_roles():
+    server_api = Role('server_api')
+    server_api.lockdown(Bicycle).readable_by(Bicycle.group == ContextParam('group'))
+
+    rest_api = server_api.extend('rest_api')
+    rest_api.lockdown(BaseModel).field_writeable_by(BaseModel.created, NO_ONE)
+    return server_api, rest_api
+
+
+@with_setup(setup)
+def test_policy_rules():
+    server_api, rest_api = build_roles()
+    policy = Policy([rest_api])
+
+    assert policy.role_names == ['rest_api', 'server_api']
+    read_rules = lambda all_rules: [(rules.model_class, rules.read_rule) for rules in all_rules]
+    assert read_rules(policy.get_rules('rest_api', Bicycle)) == read_rules(rest_api.get_rules(Bicycle))
+    assert read_rules(policy.get_rules('server_api', Bicycle)) == read_rules(server_api.get_rules(Bicycle))
+    assert policy.get_rules('server_api', User) == ()
+
+    try:
+        policy.get_rules('missing', Bicycle)
+        assert False, 'should have failed'
+    except LockdownException:
+        pass
+
+    try:
+        policy.foo = 1
+        assert False, 'should have failed'
+    except AttributeError:
+        pass
+
+
+@with_setup(setup)
+def test_policy_serialize():
+    server_api, rest_api = build_roles()
+    policy = Policy.loads(Policy([rest_api]).dumps())
+
+    rules = policy.get_rules('rest_api', Bicycle)
+    assert len(rules) == 2
+
+    lockdown_context.role = policy.role('rest_api')
+    lockdown_context.group = 10
+    sql, params = Bicycle.select().sql()
+    assert '"group_id" = ?' in sql
+    assert params[0] == 10
+
+
+@with_setup(setup)
+def test_policy_install():
+    server_api, rest_api = build_roles()
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        g = Group.create(name='test')
+        b = Bicycle.create(group=g)
+
+        try:
+            policy_role('rest_api')
+            assert False, 'should have failed, no policy installed'
+        except LockdownException:
+            pass
+
+        install(Policy([rest_api]))
+        lockdown_context.role = policy_role('rest_api')
+        assert b.is_readable() is False
+
+        # swap in a policy where the rest api can read everything
+        open_api = Role('rest_api')
+        open_api.lockdown(Bicycle)
+        install(Policy([open_api]))
+
+        # a request in flight keeps the policy it started with
+        assert b.is_readable() is False
+
+        lockdown_context.role = policy_role('rest_api')
+        assert b.is_readable() is True
+
+
+@with_setup(setup)
+def test_policy_snapshot_copies_rules():
+    server_api, rest_api = build_roles()
+    policy = Policy([rest_api])
+
+    server_api.rules[Bicycle].readable_by(NO_ONE)
+    rules = policy.get_rules('server_api', Bicycle)
+    assert rules[0].read_rule is not NO_ONE
+    assert rules[0] is not server_api.rules[Bicycle]
+    # the rules server_api shares with rest_api are copied once
+    assert rules[0] is policy.get_rules('rest_api', Bicycle)[0]
+
+
+@with_setup(setup)
+def test_policy_snapshot_drops_roles():
+    server_api, rest_api = build_roles()
+    policy = Policy.loads(Policy([rest_api]).dumps())
+
+    for rules in policy.get_rules('rest_api', Bicycle):
+        assert rules.role is None
+    assert [rules.role_name for rules in policy.get_rules('rest_api', Bicycle)] == ['server_api', 'rest_api']
@@ -0,0 +1,173 @@
+from __future__ import absolute_import
+from nose import with_setup
+
+from peewee import PostgresqlDatabase
+from playhouse.test_utils import test_database
+from lockdown import Role, LockdownException
+from lockdown.context import ContextParam, lockdown_context
+from lockdown.rls import PostgresRowSecurity, SqliteRowSecurity, enforce_in_database
+from tests import test_db, Bicycle, User, Group, BaseModel
+
+
+def setup():
+    lockdown_context.role = None
+    lockdown_context.user = None
+    lockdown_context.group = None
+
+
+def build_role():
+    rest_api = Role('rest_api')
+    rest_api.lockdown(Bicycle) \
+        .readable_by((Bicycle.group == ContextParam('group')) | (Bicycle.serial << ['public', "o'neil"])) \
+        .writeable_by(Bicycle.owner == ContextParam('user'))
+    return rest_api
+
+
+@with_setup(setup)
+def test_sqlite_views():
+    rest_api = build_role()
+    rls = SqliteRowSecurity([rest_api])
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        assert rls.context_vars() == ['group', 'user']
+        g1 = Group.create(name='test1')
+        g2 = Group.create(name='test2')
+        Bicycle.create(group=g1, serial='1')
+        Bicycle.create(group=g2, serial='2')
+        Bicycle.create(group=g2, serial='public')
+
+        for statement in rls.statements():
+            test_db.execute_sql(statement)
+
+        try:
+            def view_serials():
+                rls.apply_settings(test_db)
+                cursor = test_db.execute_sql('SELECT serial FROM "rest_api_bicycle" ORDER BY id')
+                return [row[0] for row in cursor.fetchall()]
+
+            # no role, nothing is visible through the view
+            assert view_serials() == []
+
+            lockdown_context.role = rest_api
+            lockdown_context.group = g1
+            assert view_serials() == ['1', 'public']
+
+            lockdown_context.group = g2.id
+            assert view_serials() == ['2', 'public']
+        finally:
+            for statement in rls.drop_statements():
+                test_db.execute_sql(statement)
+
+
+@with_setup(setup)
+def test_postgres_policies():
+    rest_api = build_role()
+    rls = PostgresRowSecurity([rest_api], PostgresqlDatabase('lockdown'), models=[Bicycle])
+
+    statements = rls.statements()
+    assert statements[0] == 'ALTER TABLE "bicycle" ENABLE ROW LEVEL SECURITY'
+    # without a role the context is unrestricted, like in python, but only
+    # when that's set explicitly
+    assert statements[2] == (
+        'CREATE POLICY "lockdown_unrestricted" ON "bicycle" FOR ALL USING '
+        '(NULLIF(current_setting(\'lockdown.unrestricted\', true), \'\') = \'true\')')
+    assert statements[3] == (
+        'CREATE POLICY "lockdown_rest_api_select" ON "bicycle" FOR SELECT USING '
+        '(NULLIF(current_setting(\'lockdown.role\', true), \'\') = \'rest_api\' AND '
+        '("group_id" = CAST(NULLIF(current_setting(\'lockdown.group\', true), \'\') AS INTEGER) OR '
+        '"serial" IN (\'public\', \'o\'\'neil\')))')
+    assert statements[6].startswith('CREATE POLICY "lockdown_rest_api_delete" ON "bicycle" FOR DELETE USING ')
+    assert statements[6].endswith(
+        '"owner_id" = CAST(NULLIF(current_setting(\'lockdown.user\', true), \'\') AS INTEGER))')
+
+    callable_api = Role('callable_api')
+    callable_api.lockdown(Bicycle).readable_by(lambda b: True)
+    try:
+        PostgresRowSecurity([callable_api], models=[Bicycle]).statements()
+        assert False, 'should have failed'
+    except LockdownException:
+        pass
+
+    class RecordingDatabase(object):
+        def __init__(self):
+            self.executed = []
+
+        def execute_sql(self, sql, params):
+            self.executed.append((sql, params))
+
+    # the settings only last for the current transaction
+    database = RecordingDatabase()
+    rls.apply_settings(database)
+    assert database.executed == [(
+        'SELECT set_config(%s, %s, true), set_config(%s, %s, true), '
+        'set_config(%s, %s, true), set_config(%s, %s, true)',
+        ['lockdown.role', '', 'lockdown.unrestricted', 'true', 'lockdown.group', '', 'lockdown.user', ''])]
+
+    try:
+        rls.secure_query(Bicycle, Bicycle.select())
+        assert False, 'should have failed, settings would not outlive the statement'
+    except LockdownException:
+        pass
+
+    lockdown_context.role = Role('other_api')
+    try:
+        rls.settings()
+        assert False, 'should have failed, other_api has no policies'
+    except LockdownException:
+        pass
+
+
+@with_setup(setup)
+def test_model_classes():
+    rest_api = build_role()
+    rest_api.lockdown(BaseModel).readable_by(BaseModel.created != None)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        # BaseModel has no table of its own
+        rls = SqliteRowSecurity([rest_api], test_db)
+        assert rls.model_classes() == [Bicycle, Group, User]
+        # the tables are only looked up once, not on every apply_settings
+        assert rls.model_classes() is rls.model_classes()
+        assert SqliteRowSecurity([rest_api], models=[User]).model_classes() == [User]
+
+
+@with_setup(setup)
+def test_enforce_in_database():
+    rest_api = build_role()
+    rest_api.lockdown(User).readable_by(User.id == ContextParam('user'))
+
+    rls = SqliteRowSecurity([rest_api], models=[User])
+
+    with test_database(test_db, [User]):
+        u1 = User.create(username='test1')
+        u2 = User.create(username='test2')
+        for statement in rls.statements():
+            test_db.execute_sql(statement)
+
+        # the database is trusted to filter rows, python no longer does
+        enforce_in_database(rls, User)
+        try:
+            assert [user.username for user in User.select().order_by(User.id)] == ['test1', 'test2']
+
+            lockdown_context.role = rest_api
+            lockdown_context.user = u1.id
+            sql, params = User.select().sql()
+            assert '"id" = ?' not in sql
+            assert 'FROM "rest_api_user"' in sql
+            assert [user.username for user in User.select()] == ['test1']
+            assert User.select().where(User.id == u2.id).count() == 0
+
+            # every select applies the settings of its own context
+            lockdown_context.user = u2.id
+            assert [user.username for user in User.select()] == ['test2']
+
+            lockdown_context.role = Role('other_api')
+            try:
+                User.select()
+                assert False, 'should have failed, other_api has no view'
+            except LockdownException:
+                pass
+        finally:
+            User._database_enforced = None
+            for statement in rls.drop_statements():
+                test_db.execute_sql(statement)
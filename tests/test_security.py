@@ -3,7 +3,7 @@ from datetime import datetime
 from nose import with_setup
 
 from playhouse.test_utils import test_database
-from lockdown import Role, LockdownException
+from lockdown import Role, LockdownException, model
 from lockdown.context import ContextParam, lockdown_context
 from lockdown.rules import NO_ONE
 from tests import test_db, Bicycle, User, Group, BaseModel, BigWheel
@@ -387,3 +387,95 @@ def test_combined_roles():
         # server_api can set created
         lockdown_context.role = server_api
         b.created = datetime.utcnow()
+
+
+@with_setup(setup)
+def test_diamond_roles():
+    base_api = Role('base_api')
+    base_rules = base_api.lockdown(BaseModel).field_writeable_by(BaseModel.created, NO_ONE)
+    bike_rules = base_api.lockdown(Bicycle).readable_by(Bicycle.group == ContextParam('group'))
+
+    user_api = base_api.extend('user_api')
+    group_api = base_api.extend('group_api')
+    admin_api = Role('admin_api', [user_api, group_api])
+    admin_rules = admin_api.lockdown(Bicycle).writeable_by(Bicycle.owner == ContextParam('user'))
+
+    assert admin_api.linearize() == [base_api, user_api, group_api, admin_api]
+
+    # without de-duplication the base rules would be collected once per path
+    all_rules = admin_api.get_rules(Bicycle)
+    assert len(all_rules) == 3
+    assert set(map(id, all_rules)) == set(map(id, [base_rules, bike_rules, admin_rules]))
+
+    lockdown_context.role = admin_api
+    lockdown_context.group = 10
+    sql, params = Bicycle.select().sql()
+    assert sql.count('"group_id" = ?') == 1
+    assert params == [10]
+
+
+@with_setup(setup)
+def test_reauthorize():
+    rest_api = Role('rest_api')
+    read_rule = Bicycle.group == ContextParam('group')
+    serial_rule = Bicycle.owner == ContextParam('user')
+    rest_api.lockdown(Bicycle) \
+        .readable_by(read_rule) \
+        .field_readable_by(Bicycle.serial, serial_rule)
+
+    checked = []
+    original_check = model.check_rule_expr
+
+    def counting_check(instance, rule):
+        checked.append(rule)
+        return original_check(instance, rule)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        u = User.create(username='test')
+        g = Group.create(name='test')
+        Bicycle.create(owner=u, group=g, serial='1')
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g.id
+        lockdown_context.user = u.id + 1
+
+        model.check_rule_expr = counting_check
+        try:
+            b = Bicycle.get()
+            assert b.serial is None
+            # the read rule is evaluated once, not once per field
+            assert sum(1 for rule in checked if rule is read_rule) == 1
+
+            # only the rule depending on user is evaluated again
+            del checked[:]
+            lockdown_context.user = u.id
+            b.reauthorize()
+            assert b.serial == '1'
+            assert checked == [serial_rule]
+
+            del checked[:]
+            lockdown_context.group = g.id + 1
+            try:
+                b.reauthorize()
+                assert False, 'should have failed'
+            except LockdownException:
+                pass
+            assert checked == [read_rule]
+
+            # a failed reauthorize doesn't unmask fields
+            lockdown_context.user = u.id + 1
+            lockdown_context.group = g.id
+            b.reauthorize()
+            assert b.serial is None
+            lockdown_context.group = g.id + 1
+            try:
+                b.reauthorize()
+                assert False, 'should have failed'
+            except LockdownException:
+                pass
+            assert b.serial is None
+
+            # the dependencies of a rule live on its rules
+            assert id(serial_rule) in rest_api.rules[Bicycle].dependencies
+        finally:
+            model.check_rule_expr = original_check
@@ -0,0 +1,67 @@
+from __future__ import absolute_import
+from nose import with_setup
+
+from playhouse.test_utils import test_database
+from lockdown import Role
+from lockdown.context import ContextParam, lockdown_context
+from lockdown.rules import NO_ONE
+from tests import test_db, Bicycle, User, Group, BaseModel
+
+
+def setup():
+    lockdown_context.role = None
+    lockdown_context.user = None
+    lockdown_context.group = None
+
+
+@with_setup(setup)
+def test_trace():
+    server_api = Role('server_api')
+    server_api.lockdown(Bicycle) \
+        .readable_by(Bicycle.group == ContextParam('group')) \
+        .field_readable_by(Bicycle.serial, Bicycle.owner == ContextParam('user'))
+
+    rest_api = server_api.extend('rest_api')
+    rest_api.lockdown(BaseModel).field_writeable_by(BaseModel.created, NO_ONE)
+
+    with test_database(test_db, [User, Group, Bicycle]):
+        u = User.create(username='test')
+        g = Group.create(name='test')
+        Bicycle.create(owner=u, group=g, serial='1')
+
+        lockdown_context.role = rest_api
+        lockdown_context.group = g.id
+        lockdown_context.user = u.id + 1
+
+        with lockdown_context.trace() as t:
+            b = Bicycle.get()
+            assert b.serial is None
+            assert b.is_field_writeable(Bicycle.created) is False
+
+        assert lockdown_context.tracer is None
+
+        records = t.export()
+        assert records[0]['action'] == 'select'
+        assert records[0]['role'] == 'server_api'
+
+        read = [r for r in t.records if r.action == 'read' and r.field is None][0]
+        assert read.role == 'server_api'
+        assert read.source == 'Bicycle'
+        assert read.operands == (g.id, g.id)
+        assert read.result is True
+
+        serial = [r for r in t.records if r.field == 'serial'][0]
+        assert serial.operands == (u.id, u.id + 1)
+        assert serial.result is False
+
+        created = [r for r in t.records if r.field == 'created' and r.action == 'write'][0]
+        assert created.role == 'rest_api'
+        assert created.source == 'BaseModel'
+        assert created.result is False
+
+        profile = t.profile()
+        assert sum(entry['count'] for entry in profile) == len(t.records)
+        assert [entry['denied'] for entry in profile if entry['field'] == 'serial'][0] >= 1
+
+    # nothing is recorded outside of a trace
+    assert len(t.records) == len(records)